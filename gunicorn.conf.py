@@ -0,0 +1,26 @@
+"""
+Gunicorn settings for the TrainingPeaks File Processor backend
+
+Usage:
+    gunicorn main:app --config gunicorn.conf.py
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# FIT parsing is CPU-bound pure Python, so scale with processes rather than
+# threads; WEB_CONCURRENCY overrides the usual 2 * cores + 1
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = 2
+
+# Each worker also starts its own /parse-lap-data-batch process pool, one
+# process per core by default; set BATCH_POOL_WORKERS to cap it if batch
+# requests landing on several workers at once oversubscribe the host
+
+# Import main.py (fitparse profile, numba kernel) once in the master and
+# share it copy-on-write with the forked workers
+preload_app = True
+
+timeout = 120
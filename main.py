@@ -6,170 +6,237 @@ NEW FEATURES:
 - Extracts pace targets from TrainingPeaks workout structure files
 - Converts speed (m/s) to pace (min/km) format
 - Outputs target_pace_low and target_pace_high in CSV
+- /parse-lap-data and /parse-structure return the CSV as text/csv,
+  with the row count in the X-Lap-Count / X-Step-Count response header
+- /parse-lap-data-batch parses a zip of lap data FIT files across all cores
 
 Requirements:
-    pip install flask flask-cors fitparse --break-system-packages
+    pip install flask flask-cors fitparse numpy orjson --break-system-packages
+    pip install numba   # optional, JIT-compiles the HR drift kernel
+
+Production:
+    gunicorn main:app --config gunicorn.conf.py
+
+Running this file directly starts Flask's single-threaded development server.
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request
 from flask_cors import CORS
 import os
 import io
+import shutil
+import tempfile
+import struct
 import csv
 import gzip
 import zipfile
-from datetime import datetime, timedelta
+import calendar
+import functools
+import hashlib
+import threading
+import multiprocessing
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from fitparse import FitFile
-import statistics
+from fitparse.records import Crc
+import numpy as np
+import orjson
+
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional - HR drift falls back to plain NumPy without it
+    njit = None
 
 app = Flask(__name__)
-CORS(app)
+# Expose the row-count headers of the CSV endpoints to browsers
+CORS(app, expose_headers=['X-Lap-Count', 'X-Step-Count'])
 
 # ============================================================================
 # FIT PARSING FUNCTIONS
 # ============================================================================
 
-def calculate_min_hr(records, start_time, duration_seconds):
+def epoch_seconds(dt):
+    """Convert a (naive UTC) FIT datetime to integer epoch seconds"""
+    return calendar.timegm(dt.utctimetuple())
+
+def lap_window(ts_arr, start_time, duration_seconds):
+    """Return the [lo, hi) index range of ts_arr covered by a lap
+
+    ts_arr is the timestamp-sorted epoch array built by parse_fit_file, so
+    the window is located by binary search rather than a scan.
+    """
+    start_epoch = epoch_seconds(start_time)
+    lo, hi = np.searchsorted(ts_arr, (start_epoch, start_epoch + duration_seconds))
+    return int(lo), int(hi)
+
+def calculate_min_hr(hr_arr, lo, hi):
     """Calculate min heart rate from raw records within a lap window"""
-    end_time = start_time + timedelta(seconds=duration_seconds)
-    hr_values = [
-        r['heart_rate'] for r in records
-        if 'timestamp' in r and 'heart_rate' in r
-        and r['heart_rate'] is not None
-        and start_time <= r['timestamp'] < end_time
-    ]
-    return min(hr_values) if hr_values else None
-
-def calculate_hr_drift(records, start_time, duration_seconds):
+    return int(hr_arr[lo:hi].min()) if hi > lo else None
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _hr_drift_kernel(hr_arr, lo, hi):
+        """Average HR of the two halves of hr_arr[lo:hi], in a single pass"""
+        mid_point = (lo + hi) // 2
+        first_sum = 0.0
+        second_sum = 0.0
+        for i in range(lo, hi):
+            if i < mid_point:
+                first_sum += hr_arr[i]
+            else:
+                second_sum += hr_arr[i]
+        return first_sum / (mid_point - lo), second_sum / (hi - mid_point)
+else:
+    def _hr_drift_kernel(hr_arr, lo, hi):
+        """Average HR of the two halves of hr_arr[lo:hi]"""
+        mid_point = (lo + hi) // 2
+        first_half_avg = int(hr_arr[lo:mid_point].sum()) / (mid_point - lo)
+        second_half_avg = int(hr_arr[mid_point:hi].sum()) / (hi - mid_point)
+        return first_half_avg, second_half_avg
+
+def calculate_hr_drift(hr_arr, lo, hi, duration_seconds):
     """Calculate HR drift for laps > 5 minutes"""
     if duration_seconds < 300:
         return None
     
-    lap_hr_values = []
-    end_time = start_time + timedelta(seconds=duration_seconds)
-    for record in records:
-        if 'timestamp' in record and 'heart_rate' in record:
-            if record['timestamp'] >= start_time and record['timestamp'] < end_time:
-                if record['heart_rate'] is not None:
-                    lap_hr_values.append((record['timestamp'], record['heart_rate']))
-    
-    if len(lap_hr_values) < 10:
+    if hi - lo < 10:
         return None
     
-    mid_point = len(lap_hr_values) // 2
-    first_half = [hr for _, hr in lap_hr_values[:mid_point]]
-    second_half = [hr for _, hr in lap_hr_values[mid_point:]]
-    
-    if not first_half or not second_half:
-        return None
-    
-    first_half_avg = statistics.mean(first_half)
-    second_half_avg = statistics.mean(second_half)
+    first_half_avg, second_half_avg = _hr_drift_kernel(hr_arr, lo, hi)
     
     if first_half_avg == 0:
         return None
     
     drift = ((second_half_avg - first_half_avg) / first_half_avg) * 100
-    return round(drift, 2)
+    return round(float(drift), 2)
+
+# Preformatted M:SS strings for every whole-second pace from 2:00 to 12:00/km
+PACE_STRINGS = {s: f"{s // 60}:{s % 60:02d}" for s in range(120, 721)}
+
+def format_pace(seconds_per_km):
+    """Format a (non-negative) pace in seconds per km as M:SS"""
+    pace = PACE_STRINGS.get(int(seconds_per_km))
+    if pace is None:
+        minutes = int(seconds_per_km // 60)
+        seconds = int(seconds_per_km % 60)
+        pace = f"{minutes}:{seconds:02d}"
+    return pace
 
 def seconds_to_pace(seconds_per_meter):
     """Convert seconds per meter to min/km pace format"""
     if seconds_per_meter is None or seconds_per_meter == 0:
         return None
-    seconds_per_km = seconds_per_meter * 1000
-    minutes = int(seconds_per_km // 60)
-    seconds = int(seconds_per_km % 60)
-    return f"{minutes}:{seconds:02d}"
-
-def parse_fit_file(fit_data):
-    """Extract session, lap, and record data from FIT file bytes"""
-    fitfile = FitFile(io.BytesIO(fit_data))
+    return format_pace(seconds_per_meter * 1000)
+
+def parse_fit_file(fileobj):
+    """Extract session and lap data from a seekable FIT file object
+
+    Record messages are not kept; only the epoch timestamps (int64) and
+    heart rates (int16) of records that carry HR are returned, as two
+    parallel NumPy arrays in file order (i.e. sorted by timestamp).
+    """
+    fitfile = FitFile(fileobj)
     
     session_data = {}
     lap_data = []
-    record_data = []
+    rec_ts = []
+    rec_hr = []
+    
+    # Component expansion can repeat a field name within one message (e.g.
+    # avg_speed -> enhanced_avg_speed), so keep the first non-None value
+    # rather than get_values()'s last-wins dict
+    def handle_session(record):
+        for field in record.fields:
+            if field.value is not None or field.name not in session_data:
+                session_data[field.name] = field.value
+    
+    def handle_lap(record):
+        lap = {}
+        for field in record.fields:
+            if field.value is not None or field.name not in lap:
+                lap[field.name] = field.value
+        lap_data.append(lap)
     
-    for record in fitfile.get_messages():
-        if record.name == 'session':
-            for field in record.fields:
-                if field.value is not None or field.name not in session_data:
-                    session_data[field.name] = field.value
-        elif record.name == 'lap':
-            lap = {}
-            for field in record.fields:
-                if field.value is not None or field.name not in lap:
-                    lap[field.name] = field.value
-            lap_data.append(lap)
-        elif record.name == 'record':
-            record_dict = {}
-            for field in record.fields:
-                record_dict[field.name] = field.value
-            record_data.append(record_dict)
+    def handle_record(record):
+        record_dict = record.get_values()
+        if record_dict.get('timestamp') is not None and record_dict.get('heart_rate') is not None:
+            rec_ts.append(epoch_seconds(record_dict['timestamp']))
+            rec_hr.append(record_dict['heart_rate'])
     
-    return session_data, lap_data, record_data
-
-def create_lap_data_csv_content(lap_data, record_data):
-    """Create lap data CSV content as string"""
-    output = io.StringIO()
-    fieldnames = [
-        'lap_number', 'lap_name', 'start_time', 'duration_seconds',
-        'distance_meters', 'avg_heart_rate', 'min_heart_rate', 'max_heart_rate',
-        'avg_pace', 'avg_cadence', 'avg_power', 'hr_drift'
-    ]
-    writer = csv.DictWriter(output, fieldnames=fieldnames)
-    writer.writeheader()
+    handlers = {'session': handle_session, 'lap': handle_lap, 'record': handle_record}
+    for record in fitfile.get_messages(name=tuple(handlers)):
+        handlers[record.name](record)
+    
+    ts_arr = np.array(rec_ts, dtype=np.int64)
+    hr_arr = np.array(rec_hr, dtype=np.int16)
+    
+    return session_data, lap_data, ts_arr, hr_arr
+
+# Match csv.writer's default line terminator
+CSV_LINE_END = '\r\n'
+
+class _LineEcho:
+    """File-like sink whose write() returns the text, so csv.writer.writerow
+    hands back each formatted line instead of buffering it"""
+    
+    def write(self, value):
+        return value
+
+LAP_DATA_FIELDNAMES = (
+    'lap_number', 'lap_name', 'start_time', 'duration_seconds',
+    'distance_meters', 'avg_heart_rate', 'min_heart_rate', 'max_heart_rate',
+    'avg_pace', 'avg_cadence', 'avg_power', 'hr_drift'
+)
+
+def create_lap_data_csv_content(lap_data, ts_arr, hr_arr):
+    """Yield lap data CSV content line by line
+
+    Every lap column is a number, a FIT enum name or a formatted time, none
+    of which can need CSV quoting, so rows are joined directly instead of
+    going through the csv module.
+    """
+    yield ','.join(LAP_DATA_FIELDNAMES) + CSV_LINE_END
     
     for idx, lap in enumerate(lap_data, 1):
-        start_time = lap.get('start_time')
+        get = lap.get
+        start_time = get('start_time')
         start_time_str = start_time.strftime('%Y-%m-%d %H:%M:%S') if start_time else ''
         
-        duration = lap.get('total_elapsed_time')
-        distance = lap.get('total_distance')
-        avg_hr = lap.get('avg_heart_rate')
-        min_hr = lap.get('min_heart_rate')
-        if min_hr is None and start_time and duration:
-            min_hr = calculate_min_hr(record_data, start_time, duration)
-        max_hr = lap.get('max_heart_rate')
+        duration = get('total_elapsed_time')
+        lo = hi = 0
+        hr_drift = None
+        if start_time and duration:
+            lo, hi = lap_window(ts_arr, start_time, duration)
+            hr_drift = calculate_hr_drift(hr_arr, lo, hi, duration)
+        
+        min_hr = get('min_heart_rate')
+        if min_hr is None:
+            min_hr = calculate_min_hr(hr_arr, lo, hi)
         
         # Use enhanced_avg_speed for pace
-        avg_speed = lap.get('enhanced_avg_speed') or lap.get('avg_speed')
-        avg_pace = None
-        if avg_speed and avg_speed > 0:
-            avg_pace = seconds_to_pace(1.0 / avg_speed)
+        avg_speed = get('enhanced_avg_speed') or get('avg_speed')
+        avg_pace = seconds_to_pace(1.0 / avg_speed) if avg_speed and avg_speed > 0 else None
         
         # Use avg_running_cadence × 2 for steps/min
-        avg_cadence = lap.get('avg_running_cadence') or lap.get('avg_cadence')
-        avg_fractional = lap.get('avg_fractional_cadence', 0)
-        if avg_cadence:
-            avg_cadence = round((avg_cadence + avg_fractional) * 2)
+        avg_cadence = get('avg_running_cadence') or get('avg_cadence')
+        avg_cadence = (
+            round((avg_cadence + (get('avg_fractional_cadence') or 0)) * 2)
+            if avg_cadence else ''
+        )
         
-        avg_power = lap.get('avg_power')
+        intensity = get('intensity')
+        lap_name = str(intensity) if intensity else ''
         
-        lap_name = ''
-        intensity = lap.get('intensity')
-        if intensity:
-            lap_name = str(intensity)
-        
-        hr_drift = None
-        if start_time and duration:
-            hr_drift = calculate_hr_drift(record_data, start_time, duration)
-        
-        writer.writerow({
-            'lap_number': idx,
-            'lap_name': lap_name,
-            'start_time': start_time_str,
-            'duration_seconds': duration or '',
-            'distance_meters': distance or '',
-            'min_heart_rate': min_hr or '',
-            'avg_heart_rate': avg_hr or '',
-            'max_heart_rate': max_hr or '',
-            'avg_pace': avg_pace or '',
-            'avg_cadence': avg_cadence or '',
-            'avg_power': avg_power or '',
-            'hr_drift': hr_drift if hr_drift is not None else ''
-        })
-    
-    return output.getvalue()
+        yield (
+            f"{idx},{lap_name},{start_time_str},{duration or ''},"
+            f"{get('total_distance') or ''},{get('avg_heart_rate') or ''},"
+            f"{min_hr or ''},{get('max_heart_rate') or ''},"
+            f"{avg_pace or ''},{avg_cadence},{get('avg_power') or ''},"
+            f"{hr_drift if hr_drift is not None else ''}{CSV_LINE_END}"
+        )
 
 # ============================================================================
 # STRUCTURE PARSING WITH PACE SUPPORT (UPDATED)
@@ -192,60 +259,77 @@ def pace_seconds_to_string(seconds_per_km):
     """Convert pace in seconds per km to M:SS format"""
     if seconds_per_km is None:
         return None
-    minutes = int(seconds_per_km // 60)
-    seconds = int(seconds_per_km % 60)
-    return f"{minutes}:{seconds:02d}"
+    return format_pace(seconds_per_km)
+
+# Upper HR bound (inclusive) of zones 1-4; anything higher is zone 5
+ZONE_UPPER_BOUNDS = (130, 145, 160, 175)
+ZONE_NAMES = (
+    "Zone 1: Recovery",
+    "Zone 2: Aerobic",
+    "Zone 3: Tempo",
+    "Zone 4: Threshold",
+    "Zone 5: VO2 Max",
+)
+# Zone 2/3 targets whose low end dips into the zone below are reported as a range
+ZONE_RANGE_NAMES = (
+    None,
+    "Zone 1: Recovery - Zone 2: Aerobic",
+    "Zone 2: Aerobic - Zone 3: Tempo",
+    None,
+    None,
+)
 
+@functools.lru_cache(maxsize=256)
 def get_zone_name(hr_low, hr_high):
     """Determine zone name based on HR ranges"""
     if hr_low is None or hr_high is None:
         return ""
     
-    if hr_high <= 130:
-        return "Zone 1: Recovery"
-    elif hr_high <= 145:
-        if hr_low < 130:
-            return "Zone 1: Recovery - Zone 2: Aerobic"
-        return "Zone 2: Aerobic"
-    elif hr_high <= 160:
-        if hr_low < 145:
-            return "Zone 2: Aerobic - Zone 3: Tempo"
-        return "Zone 3: Tempo"
-    elif hr_high <= 175:
-        return "Zone 4: Threshold"
-    else:
-        return "Zone 5: VO2 Max"
-
-def parse_workout_structure(fit_data):
-    """Parse workout structure FIT file"""
-    fitfile = FitFile(io.BytesIO(fit_data))
+    zone = bisect_left(ZONE_UPPER_BOUNDS, hr_high)
+    range_name = ZONE_RANGE_NAMES[zone]
+    if range_name and hr_low < ZONE_UPPER_BOUNDS[zone - 1]:
+        return range_name
+    return ZONE_NAMES[zone]
+
+def parse_workout_structure(fileobj):
+    """Parse workout structure from a seekable FIT file object"""
+    fitfile = FitFile(fileobj)
     
     workout_info = {}
     workout_steps = []
     
-    for record in fitfile.get_messages():
-        if record.name == 'workout':
-            for field in record:
-                workout_info[field.name] = field.value
-        elif record.name == 'workout_step':
-            step_data = {}
-            for field in record:
-                step_data[field.name] = field.value
-            workout_steps.append(step_data)
+    def handle_workout(record):
+        workout_info.update(record.get_values())
+    
+    def handle_workout_step(record):
+        workout_steps.append(record.get_values())
+    
+    handlers = {'workout': handle_workout, 'workout_step': handle_workout_step}
+    for record in fitfile.get_messages(name=tuple(handlers)):
+        handlers[record.name](record)
     
     return workout_info, workout_steps
 
+STRUCTURE_FIELDNAMES = (
+    'step_number', 'step_name', 'duration_seconds',
+    'target_zone_low', 'target_zone_high', 'target_zone_name',
+    'target_pace_low', 'target_pace_high',
+    'step_type', 'notes'
+)
+
+# Step intensities that map to a named step_type
+STEP_TYPES = {
+    'warmup': 'warmup',
+    'cooldown': 'cooldown',
+    'rest': 'rest',
+    'active': 'active',
+    'recovery': 'recovery',
+}
+
 def create_structure_csv_content(workout_steps):
-    """Create structure CSV content with HR zones AND pace targets"""
-    output = io.StringIO()
-    fieldnames = [
-        'step_number', 'step_name', 'duration_seconds', 
-        'target_zone_low', 'target_zone_high', 'target_zone_name',
-        'target_pace_low', 'target_pace_high',
-        'step_type', 'notes'
-    ]
-    writer = csv.DictWriter(output, fieldnames=fieldnames)
-    writer.writeheader()
+    """Yield structure CSV content with HR zones AND pace targets, line by line"""
+    writer = csv.writer(_LineEcho())
+    yield writer.writerow(STRUCTURE_FIELDNAMES)
     
     for idx, step in enumerate(workout_steps, start=1):
         step_name = step.get('wkt_step_name', '')
@@ -275,18 +359,8 @@ def create_structure_csv_content(workout_steps):
         # Determine step type
         if duration_type == 'repeat_until_steps_cmplt':
             step_type = 'repeat'
-        elif intensity == 'warmup':
-            step_type = 'warmup'
-        elif intensity == 'cooldown':
-            step_type = 'cooldown'
-        elif intensity == 'rest':
-            step_type = 'rest'
-        elif intensity == 'active':
-            step_type = 'active'
-        elif intensity == 'recovery':
-            step_type = 'recovery'
         else:
-            step_type = intensity or ''
+            step_type = STEP_TYPES.get(intensity, intensity or '')
         
         # Parse duration and notes
         duration_seconds = None
@@ -301,68 +375,269 @@ def create_structure_csv_content(workout_steps):
             duration_step = step.get('duration_step', 0)
             notes = f'Repeat previous {repeat_steps} step(s) until step {duration_step} completes'
         
-        writer.writerow({
-            'step_number': idx,
-            'step_name': step_name,
-            'duration_seconds': duration_seconds if duration_seconds else '',
-            'target_zone_low': hr_low if hr_low is not None else '',
-            'target_zone_high': hr_high if hr_high is not None else '',
-            'target_zone_name': zone_name,
-            'target_pace_low': pace_low,
-            'target_pace_high': pace_high,
-            'step_type': step_type,
-            'notes': notes
-        })
+        yield writer.writerow((
+            idx,
+            step_name,
+            duration_seconds if duration_seconds else '',
+            hr_low if hr_low is not None else '',
+            hr_high if hr_high is not None else '',
+            zone_name,
+            pace_low,
+            pace_high,
+            step_type,
+            notes
+        ))
+
+# ============================================================================
+# PARSE RESULT CACHE
+# ============================================================================
+
+class ParseCache:
+    """Thread-safe LRU cache of parse results keyed by upload content hash"""
+    
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            return result
+    
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+# Read size for hashing and decompressing uploads
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+def stream_digest(stream):
+    """Hash an upload stream chunk by chunk into a cache key, then rewind it"""
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.digest()
+
+LAP_DATA_CACHE = ParseCache()
+STRUCTURE_CACHE = ParseCache()
+
+# ============================================================================
+# BATCH PARSING
+# ============================================================================
+
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+def batch_pool_size():
+    """Number of processes in each gunicorn worker's batch pool
+
+    Defaults to one per core so a single batch spreads across the machine.
+    Every gunicorn worker owns its own pool, so concurrent batch requests on
+    several workers can oversubscribe the cores; set BATCH_POOL_WORKERS to
+    cap the pool if that matters more than per-batch latency.
+    """
+    if os.environ.get('BATCH_POOL_WORKERS'):
+        return max(1, int(os.environ['BATCH_POOL_WORKERS']))
+    return os.cpu_count() or 1
+
+def get_batch_pool():
+    """Return this process's batch parsing pool, creating it on first use
+
+    The pool is created lazily rather than at import so that each gunicorn
+    worker (forked after preload) owns its own pool. Children come from a
+    forkserver because gunicorn's threaded workers are unsafe to fork.
+    """
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            _batch_pool = ProcessPoolExecutor(
+                max_workers=batch_pool_size(),
+                mp_context=multiprocessing.get_context('forkserver')
+            )
+        return _batch_pool
+
+def discard_batch_pool(pool):
+    """Drop a broken pool so the next get_batch_pool() builds a fresh one"""
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is pool:
+            _batch_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def map_batch(fn, *iterables):
+    """Map fn over the batch pool, retrying once on a fresh pool if a child
+    died (e.g. OOM-killed) and left the pool broken"""
+    pool = get_batch_pool()
+    try:
+        return list(pool.map(fn, *iterables))
+    except BrokenProcessPool:
+        discard_batch_pool(pool)
+        pool = get_batch_pool()
+        try:
+            return list(pool.map(fn, *iterables))
+        except BrokenProcessPool:
+            discard_batch_pool(pool)
+            raise
+
+def parse_lap_data_file(filename, file_data):
+    """Parse one .fit or .fit.gz file's bytes into a lap data result dict
+
+    Runs inside the batch pool, so failures are returned rather than raised
+    to keep one bad file from failing the whole batch.
+    """
+    try:
+        if filename.lower().endswith('.gz'):
+            file_data = gzip.decompress(file_data)
+        
+        session_data, lap_data, ts_arr, hr_arr = parse_fit_file(io.BytesIO(file_data))
+        return {
+            'filename': filename,
+            'success': True,
+            'csv': ''.join(create_lap_data_csv_content(lap_data, ts_arr, hr_arr)),
+            'lap_count': len(lap_data)
+        }
     
-    return output.getvalue()
+    except Exception as e:
+        return {
+            'filename': filename,
+            'success': False,
+            'error': str(e)
+        }
 
 # ============================================================================
 # FLASK API ENDPOINTS
 # ============================================================================
 
+# Decompressed uploads beyond this size spill from memory to a temp file
+GZIP_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+def gunzip_to_spool(stream):
+    """Decompress a gzip stream incrementally into a seekable spooled file
+
+    FitFile seeks to the end of its input to find the file size, which
+    GzipFile does not support, so the upload can't be handed over as-is.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=GZIP_SPOOL_MAX_SIZE)
+    with gzip.GzipFile(fileobj=stream) as gz:
+        shutil.copyfileobj(gz, spool, UPLOAD_CHUNK_SIZE)
+    spool.seek(0)
+    return spool
+
+def json_response(payload):
+    """Serialize a JSON response body with orjson instead of Flask's jsonify"""
+    return Response(orjson.dumps(payload), mimetype='application/json')
+
+def csv_response(lines, count_header, count):
+    """Return already-built CSV lines as a text/csv response
+
+    Lines are built before the response is created so formatting errors
+    still reach the route's JSON error handler.
+    """
+    return Response(lines, mimetype='text/csv', headers={count_header: str(count)})
+
 @app.route('/parse-lap-data', methods=['POST'])
 def parse_lap_data():
-    """Parse lap data FIT file (.fit or .fit.gz)"""
+    """Parse lap data FIT file (.fit or .fit.gz), returned as text/csv"""
     try:
         file = request.files['file']
-        file_data = file.read()
+        is_gzip = file.filename.lower().endswith('.gz')
         
-        if file.filename.endswith('.gz'):
-            file_data = gzip.decompress(file_data)
+        cache_key = (is_gzip, stream_digest(file.stream))
+        cached = LAP_DATA_CACHE.get(cache_key)
+        if cached is not None:
+            lines, lap_count = cached
+            return csv_response(lines, 'X-Lap-Count', lap_count)
+        
+        # Werkzeug spools uploads to a seekable file, so FitFile can read the
+        # upload in place without copying it into memory first
+        fit_file = gunzip_to_spool(file.stream) if is_gzip else file.stream
+        try:
+            session_data, lap_data, ts_arr, hr_arr = parse_fit_file(fit_file)
+        finally:
+            if is_gzip:
+                # Release the spool's temp file as soon as parsing is done
+                fit_file.close()
         
-        session_data, lap_data, record_data = parse_fit_file(file_data)
-        csv_content = create_lap_data_csv_content(lap_data, record_data)
+        lines = list(create_lap_data_csv_content(lap_data, ts_arr, hr_arr))
+        lap_count = len(lap_data)
+        LAP_DATA_CACHE.put(cache_key, (lines, lap_count))
         
-        return jsonify({
+        return csv_response(lines, 'X-Lap-Count', lap_count)
+    
+    except Exception as e:
+        return json_response({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/parse-lap-data-batch', methods=['POST'])
+def parse_lap_data_batch():
+    """Parse every .fit / .fit.gz file in a .zip upload across all cores"""
+    try:
+        file = request.files['file']
+        
+        with zipfile.ZipFile(file.stream) as zip_ref:
+            # Skip directory entries and the resource forks macOS Archive Utility
+            # adds under __MACOSX/, which share the real files' names
+            fit_files = [
+                name for name in zip_ref.namelist()
+                if not name.endswith('/') and not name.startswith('__MACOSX/')
+                and name.lower().endswith(('.fit', '.fit.gz'))
+            ]
+            
+            if not fit_files:
+                return json_response({
+                    'success': False,
+                    'error': 'No FIT files found in zip'
+                }), 400
+            
+            file_datas = [zip_ref.read(name) for name in fit_files]
+        
+        results = map_batch(parse_lap_data_file, fit_files, file_datas)
+        
+        return json_response({
             'success': True,
-            'csv': csv_content,
-            'lap_count': len(lap_data)
+            'files': results,
+            'file_count': len(results)
         })
     
     except Exception as e:
-        return jsonify({
+        return json_response({
             'success': False,
             'error': str(e)
         }), 500
 
 @app.route('/parse-structure', methods=['POST'])
 def parse_structure():
-    """Parse workout structure FIT file - NOW INCLUDES PACE TARGETS"""
+    """Parse workout structure FIT file - NOW INCLUDES PACE TARGETS
+
+    Returned as text/csv.
+    """
     try:
         file = request.files['file']
-        file_data = file.read()
         
-        workout_info, workout_steps = parse_workout_structure(file_data)
-        csv_content = create_structure_csv_content(workout_steps)
+        cache_key = stream_digest(file.stream)
+        cached = STRUCTURE_CACHE.get(cache_key)
+        if cached is not None:
+            lines, step_count = cached
+            return csv_response(lines, 'X-Step-Count', step_count)
         
-        return jsonify({
-            'success': True,
-            'csv': csv_content,
-            'step_count': len(workout_steps)
-        })
+        workout_info, workout_steps = parse_workout_structure(file.stream)
+        lines = list(create_structure_csv_content(workout_steps))
+        step_count = len(workout_steps)
+        STRUCTURE_CACHE.put(cache_key, (lines, step_count))
+        
+        return csv_response(lines, 'X-Step-Count', step_count)
     
     except Exception as e:
-        return jsonify({
+        return json_response({
             'success': False,
             'error': str(e)
         }), 500
@@ -373,25 +648,25 @@ def unzip_file():
     try:
         file = request.files['file']
         
-        with zipfile.ZipFile(io.BytesIO(file.read())) as zip_ref:
+        with zipfile.ZipFile(file.stream) as zip_ref:
             csv_files = [name for name in zip_ref.namelist() if name.endswith('.csv')]
             
             if not csv_files:
-                return jsonify({
+                return json_response({
                     'success': False,
                     'error': 'No CSV file found in zip'
                 }), 400
             
             csv_content = zip_ref.read(csv_files[0]).decode('utf-8')
             
-            return jsonify({
+            return json_response({
                 'success': True,
                 'csv': csv_content,
                 'filename': csv_files[0]
             })
     
     except Exception as e:
-        return jsonify({
+        return json_response({
             'success': False,
             'error': str(e)
         }), 500
@@ -399,7 +674,38 @@ def unzip_file():
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({'status': 'ok', 'message': 'TrainingPeaks FIT Parser API v2.0 (with PACE support)'})
+    return json_response({'status': 'ok', 'message': 'TrainingPeaks FIT Parser API v2.0 (with PACE support)'})
+
+# ============================================================================
+# WARM-UP
+# ============================================================================
+
+def build_warmup_fit():
+    """Build a tiny FIT file holding a single record (timestamp + heart rate)"""
+    body = (
+        # Definition message: local type 0 -> global 'record' (20), little
+        # endian, fields timestamp (253, uint32) and heart_rate (3, uint8)
+        struct.pack('<BBBHB', 0x40, 0, 0, 20, 2) + bytes((253, 4, 0x86, 3, 1, 0x02))
+        # Data message for local type 0
+        + struct.pack('<BIB', 0x00, 1000000000, 60)
+    )
+    data = struct.pack('<BBHI4s', 12, 0x10, 2093, len(body), b'.FIT') + body
+    return data + struct.pack('<H', Crc(byte_arr=data).value)
+
+def warm_up():
+    """Run the FIT decode path and HR drift kernel once at import
+
+    Under gunicorn preload this happens once in the master, so the first
+    request a worker serves doesn't pay for fitparse's lazy setup or for
+    loading/compiling the numba kernel.
+    """
+    session_data, lap_data, ts_arr, hr_arr = parse_fit_file(io.BytesIO(build_warmup_fit()))
+    _hr_drift_kernel(np.repeat(hr_arr, 2), 0, 2)
+
+try:
+    warm_up()
+except Exception as e:
+    app.logger.warning("Warm-up skipped: %s", e)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -410,10 +716,13 @@ if __name__ == '__main__':
     print(f"\nStarting Flask server on 0.0.0.0:{port}")
     print("\nEndpoints:")
     print("  POST /parse-lap-data    - Parse lap data FIT files")
+    print("  POST /parse-lap-data-batch - Parse a zip of lap data FIT files")
     print("  POST /parse-structure   - Parse workout structure (HR + PACE)")
     print("  POST /unzip             - Unzip and extract CSV")
     print("  GET  /health            - Health check")
     print("\nNEW: Extracts pace targets from TrainingPeaks workouts")
+    print("\nDevelopment server only - in production run:")
+    print("  gunicorn main:app --config gunicorn.conf.py")
     print("=" * 70)
     
     app.run(host='0.0.0.0', port=port, debug=False)